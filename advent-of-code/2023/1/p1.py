@@ -1,6 +1,22 @@
 # Advent of Code, Day 1
+from __future__ import annotations
 
+import io
+import math
+import mmap
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Callable, Optional
+
+CoordinatesFunction = Callable[[str], int]
+
+# Chunks handed to each worker, so uneven chunks still balance out.
+CHUNKS_PER_WORKER = 4
+
+# Every byte except ASCII digits and newlines, for bytes.translate.
+NON_DIGIT_BYTES = bytes(x for x in range(256) if x not in b"0123456789\n")
 
 number_map = {
     "zero": "0",
@@ -16,6 +32,32 @@ number_map = {
 }
 
 
+# Digits or number words, and the same with the words reversed to search
+# reversed lines. No word is a prefix of another, so the leftmost match of
+# each search is the first number, and the last number of the line.
+number_pattern = re.compile(r"\d|" + "|".join(number_map))
+reversed_number_pattern = re.compile(
+    r"\d|" + "|".join(word[::-1] for word in number_map)
+)
+
+
+def find_first_number(line: str) -> Optional[str]:
+    match = number_pattern.search(line)
+    if match is None:
+        return None
+
+    return number_map.get(match[0], match[0])
+
+
+def find_last_number(line: str) -> Optional[str]:
+    match = reversed_number_pattern.search(line[::-1])
+    if match is None:
+        return None
+
+    word = match[0][::-1]
+    return number_map.get(word, word)
+
+
 def get_coordinates(line: str) -> int:
     """
     Extracts the coordinates from a given string.
@@ -41,10 +83,13 @@ def get_coordinates(line: str) -> int:
 
 def get_coordinates_including_word(line: str) -> int:
     """
-    Extracts coordinates from a given string by searching for a pattern that
-    includes digits or specific words representing numbers.
+    Extracts coordinates from a given string by searching for digits or
+    specific words representing numbers.
     Converts the extracted coordinates into an integer.
 
+    The first number is found searching the line and the last one searching
+    the reversed line, both stopping at the first match.
+
     Args:
         line (str): The input string from which coordinates are extracted.
 
@@ -54,32 +99,155 @@ def get_coordinates_including_word(line: str) -> int:
     Raises:
         ValueError: If no matches are found in the input string.
     """
-    pattern = r"(?=\d|zero|one|two|three|four|five|six|seven|eight|nine)(?=(zero|one|two|three|four|five|six|seven|eight|nine|\d))"  # noqa: E501
-    matches = re.findall(pattern, line)
+    first = find_first_number(line)
 
-    if not matches:
+    if first is None:
         raise ValueError(f"Input does not have any digits. ({line=})")
 
-    coordinate_list = [
-        number_map.get(match, match) for match in [matches[0], matches[-1]]
-    ]
-    coordinates = "".join(coordinate_list)
+    last = find_last_number(line)
+    coordinates = f"{first}{last}"
 
     return int(coordinates)
 
 
-def process_input(filename: str) -> int:
+def get_coordinates_total(data: bytes) -> int:
+    """
+    Sums the digits-only coordinates of every line in `data` at once.
+
+    Non-digits are dropped with a single `bytes.translate`, then the first
+    and last digit of every line are collected with multiline regex scans.
+    The result matches summing `get_coordinates` over every line.
+
+    Args:
+        data (bytes): The raw input, lines separated by newlines.
+
+    Returns:
+        int: The sum of the coordinates of every line.
+
+    Raises:
+        ValueError: If a line does not contain any digit.
+    """
+    if not data:
+        return 0
+
+    digits = data.translate(None, NON_DIGIT_BYTES)
+    lines = digits.count(b"\n") + (not data.endswith(b"\n"))
+
+    first_digits = b"".join(re.findall(rb"^\d", digits, re.MULTILINE))
+    last_digits = b"".join(re.findall(rb"\d$", digits, re.MULTILINE))
+
+    if len(first_digits) != lines:
+        number = digits.split(b"\n").index(b"") + 1
+        raise ValueError(f"Input does not contain any digit (line {number})")
+
+    zero = ord("0") * lines
+    return 10 * (sum(first_digits) - zero) + (sum(last_digits) - zero)
+
+
+def process_input(
+    filename: str,
+    coordinates_function: CoordinatesFunction = get_coordinates_including_word,
+) -> int:
     total: int = 0
     with open(filename, "r") as file:
         for line in file:
-            # sum += get_coordinates(line)
-            total += get_coordinates_including_word(line)
+            total += coordinates_function(line)
 
     return total
 
 
+def process_input_digits(filename: str) -> int:
+    with open(filename, "rb") as file:
+        return get_coordinates_total(file.read())
+
+
+# BULK MODE
+
+
+def get_chunk_bounds(data: mmap.mmap, chunks: int) -> list[tuple[int, int]]:
+    """
+    Splits the mapped data into roughly `chunks` byte ranges, each one ending
+    right after a newline (or at the end of the data).
+    """
+    size = len(data)
+    chunk_size = max(1, math.ceil(size / chunks))
+    bounds: list[tuple[int, int]] = list()
+
+    start = 0
+    while start < size:
+        end = min(start + chunk_size, size)
+        newline = data.find(b"\n", end - 1)
+        end = size if newline == -1 else newline + 1
+
+        bounds.append((start, end))
+        start = end
+
+    return bounds
+
+
+def process_chunk(
+    filename: str,
+    start: int,
+    end: int,
+    coordinates_function: CoordinatesFunction,
+) -> int:
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            chunk = data[start:end].decode()
+
+    total = 0
+    # Universal newlines, like iterating a file opened in text mode
+    for line in io.StringIO(chunk, newline=None):
+        total += coordinates_function(line)
+
+    return total
+
+
+def process_input_parallel(
+    filename: str,
+    coordinates_function: CoordinatesFunction = get_coordinates_including_word,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Memory-maps the input file, splits it into newline-aligned chunks and sums
+    the coordinates of every chunk in a process pool.
+
+    Args:
+        filename (str): The input file.
+        coordinates_function (CoordinatesFunction): Either `get_coordinates`
+            or `get_coordinates_including_word`. Must be picklable.
+        workers (Optional[int]): Number of worker processes. Defaults to the
+            number of CPUs.
+
+    Returns:
+        int: The sum of the coordinates of every line.
+    """
+    if os.path.getsize(filename) == 0:
+        return 0
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            bounds = get_chunk_bounds(data, workers * CHUNKS_PER_WORKER)
+
+    starts = [start for start, _ in bounds]
+    ends = [end for _, end in bounds]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_totals = executor.map(
+            process_chunk,
+            repeat(filename),
+            starts,
+            ends,
+            repeat(coordinates_function),
+        )
+        return sum(partial_totals)
+
+
 if __name__ == "__main__":
     filename = "advent-of-code/2023/1/p1_input.txt"
 
-    sum = process_input(filename)
+    sum = process_input_parallel(filename)
     print(sum)
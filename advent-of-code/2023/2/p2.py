@@ -1,52 +1,314 @@
+from __future__ import annotations
+
 import math
-import re
+import time
+from array import array
+from bisect import bisect_right
+from itertools import compress, islice, repeat
+from operator import and_, le, mul
+from typing import Iterable, Optional
 
 # Advent of Code, Day 2
 
 
-def parse_game_file(filename) -> dict[int, dict[str, int]]:
-    games: dict[int, dict[str, int]] = dict()
-    with open(filename, "r") as file:
-        for line in file:
-            game_number, max_colors = parse_game(line)
-            games[game_number] = max_colors
+class GameTable:
+    """
+    Columnar store of the parsed games: the game numbers and the maximum
+    number of red, green and blue cubes are kept in parallel integer arrays.
+    """
+
+    def __init__(self):
+        self.game_numbers: array[int] = array("I")
+        self.red: array[int] = array("I")
+        self.green: array[int] = array("I")
+        self.blue: array[int] = array("I")
+
+    def append(self, game_number: int, red: int, green: int, blue: int):
+        self.game_numbers.append(game_number)
+        self.red.append(red)
+        self.green.append(green)
+        self.blue.append(blue)
+
+    def __len__(self) -> int:
+        return len(self.game_numbers)
+
+    def __repr__(self):
+        return f"GameTable({len(self)} games)"
+
+
+def parse_game_file(filename) -> GameTable:
+    with open(filename, "rb") as file:
+        return parse_game_lines(file)
+
+
+def parse_game_lines(
+    lines: Iterable[bytes | memoryview], games: Optional[GameTable] = None
+) -> GameTable:
+    if games is None:
+        games = GameTable()
+
+    for line in lines:
+        games.append(*scan_game(line))
 
     return games
 
 
-def parse_game(line: str) -> tuple[int, dict[str, int]]:
-    game_part, *draws = re.split(":|;|, ", line)
+COLON = ord(":")
+SPACE = ord(" ")
+ZERO = ord("0")
+NINE = ord("9")
+LOWER_A = ord("a")
+LOWER_Z = ord("z")
+
+
+def scan_game(line: bytes | memoryview) -> tuple[int, int, int, int]:
+    """
+    Scans a game line byte by byte, without splitting it into substrings.
+
+    Digits are accumulated into the current number. Before the colon that
+    number is the game number; after it, the word following a number names
+    its color and updates that color's maximum.
 
-    game_number_match = re.search(r"Game (\d+)", game_part)
+    Args:
+        line (bytes | memoryview): A line such as b"Game 1: 3 blue, 4 red".
 
-    if game_number_match:
-        game_number = int(game_number_match[1])
-    else:
-        raise ValueError(f"No game number found: {line}")
+    Returns:
+        tuple[int, int, int, int]: The game number and the red, green and
+        blue maxima.
 
-    max_colors: dict[str, int] = {"red": 0, "blue": 0, "green": 0}
-    for draw in draws:
-        num, color = draw.strip().split(" ")
-        max_colors[color] = max(max_colors.get(color, 0), int(num))
+    Raises:
+        ValueError: If there is no game number or a color is unknown.
+    """
+    game_number = -1
+    red = green = blue = 0
+    number = -1
+    in_header = True
+
+    i = 0
+    while i < len(line):
+        byte = line[i]
+        if ZERO <= byte <= NINE:
+            number = (0 if number < 0 else number * 10) + byte - ZERO
+        elif in_header:
+            if byte == COLON:
+                game_number = number
+                number = -1
+                in_header = False
+        elif number >= 0 and byte != SPACE:
+            end = i
+            while end < len(line) and LOWER_A <= line[end] <= LOWER_Z:
+                end += 1
+
+            color = line[i:end]
+            if color == b"red":
+                red = max(red, number)
+            elif color == b"green":
+                green = max(green, number)
+            elif color == b"blue":
+                blue = max(blue, number)
+            else:
+                raise ValueError(f"Unknown color: {bytes(line)!r}")
+            number = -1
+            i = end
+            continue
+        i += 1
+
+    if game_number < 0:
+        raise ValueError(f"No game number found: {bytes(line)!r}")
+
+    return game_number, red, green, blue
+
+
+def parse_game(line: str) -> tuple[int, dict[str, int]]:
+    game_number, red, green, blue = scan_game(line.encode())
+    max_colors: dict[str, int] = {"red": red, "blue": blue, "green": green}
 
     return game_number, max_colors
 
 
 def get_possible_games(
-    games: dict[int, dict[str, int]], max_colors: dict[str, int]
+    games: GameTable, max_colors: dict[str, int]
 ) -> list[int]:
-    possible_games: list[int] = list()
+    # Element-wise `color <= limit` over each column, and-ed together.
+    red_ok = map(le, games.red, repeat(max_colors["red"]))
+    green_ok = map(le, games.green, repeat(max_colors["green"]))
+    blue_ok = map(le, games.blue, repeat(max_colors["blue"]))
+
+    possible = map(and_, map(and_, red_ok, green_ok), blue_ok)
+
+    return list(compress(games.game_numbers, possible))
+
+
+# Largest dense prefix-sum table GameIndex builds, in cells.
+DENSE_TABLE_LIMIT = 1 << 20
+
+
+class GameIndex:
+    """
+    Answers many bag-limit queries over the same GameTable.
 
-    for game_number, game_colors in games.items():
-        possible = True
-        for color, color_number in game_colors.items():
-            if color_number > max_colors[color]:
-                possible = False
-                break
-        if possible:
-            possible_games.append(game_number)
+    Games are bucketed by their (red, green, blue) maxima, compressed to the
+    distinct values of each color. A 3-D prefix sum over the buckets holds
+    the number and the game number sum of the games dominated by each bucket,
+    so a query costs three bisects and one lookup. The table has one entry
+    per combination of distinct color values, so it grows with the cube of
+    the distinct values: past `DENSE_TABLE_LIMIT` cells it is not built, and
+    queries instead scan the games sorted by red up to the red limit.
 
-    return possible_games
+    `build_seconds` and `query_seconds` track the time spent building the
+    index and answering queries.
+    """
+
+    def __init__(self, games: GameTable):
+        start = time.perf_counter()
+
+        self.reds = sorted(set(games.red))
+        self.greens = sorted(set(games.green))
+        self.blues = sorted(set(games.blue))
+        self.game_numbers = games.game_numbers
+
+        # Positions in the table of the games in each bucket.
+        self.buckets: dict[tuple[int, int, int], list[int]] = dict()
+
+        columns = zip(games.game_numbers, games.red, games.green, games.blue)
+        for position, (game_number, red, green, blue) in enumerate(columns):
+            cell = (
+                bisect_right(self.reds, red),
+                bisect_right(self.greens, green),
+                bisect_right(self.blues, blue),
+            )
+            self.buckets.setdefault(cell, list()).append(position)
+
+        size = (
+            (len(self.reds) + 1)
+            * (len(self.greens) + 1)
+            * (len(self.blues) + 1)
+        )
+        self.dense = size <= DENSE_TABLE_LIMIT
+        if self.dense:
+            self.build_table(games, size)
+        else:
+            self.build_sorted_columns(games)
+
+        self.build_seconds = time.perf_counter() - start
+        self.query_seconds = 0.0
+        self.queries = 0
+
+    def build_table(self, games: GameTable, size: int):
+        self.counts: array[int] = array("q", bytes(8 * size))
+        self.number_sums: array[int] = array("q", bytes(8 * size))
+
+        for cell, bucket in self.buckets.items():
+            flat = self.flat_index(*cell)
+            self.counts[flat] += len(bucket)
+            self.number_sums[flat] += sum(
+                games.game_numbers[i] for i in bucket
+            )
+
+        for table in (self.counts, self.number_sums):
+            self.accumulate(table)
+
+    def build_sorted_columns(self, games: GameTable):
+        # The columns ordered by red, so a red limit selects a prefix.
+        order = sorted(range(len(games)), key=games.red.__getitem__)
+        self.sorted_red = [games.red[i] for i in order]
+        self.sorted_green = array("I", (games.green[i] for i in order))
+        self.sorted_blue = array("I", (games.blue[i] for i in order))
+        self.sorted_numbers = array(
+            "I", (games.game_numbers[i] for i in order)
+        )
+
+    def flat_index(self, red: int, green: int, blue: int) -> int:
+        return (red * (len(self.greens) + 1) + green) * (
+            len(self.blues) + 1
+        ) + blue
+
+    def accumulate(self, table: array[int]):
+        # Prefix sums along the blue, green and red axes in turn.
+        blue_stride = 1
+        green_stride = len(self.blues) + 1
+        red_stride = (len(self.greens) + 1) * green_stride
+
+        for stride, axis_size in (
+            (blue_stride, green_stride),
+            (green_stride, red_stride // green_stride),
+            (red_stride, len(self.reds) + 1),
+        ):
+            for i in range(len(table)):
+                if (i // stride) % axis_size:
+                    table[i] += table[i - stride]
+
+    def get_cell(self, max_colors: dict[str, int]) -> tuple[int, int, int]:
+        return (
+            bisect_right(self.reds, max_colors["red"]),
+            bisect_right(self.greens, max_colors["green"]),
+            bisect_right(self.blues, max_colors["blue"]),
+        )
+
+    def get_totals(self, max_colors: dict[str, int]) -> tuple[int, int]:
+        # Number and game number sum of the fitting games
+        if self.dense:
+            flat = self.flat_index(*self.get_cell(max_colors))
+            return self.counts[flat], self.number_sums[flat]
+
+        stop = bisect_right(self.sorted_red, max_colors["red"])
+        green_ok = map(
+            le, islice(self.sorted_green, stop), repeat(max_colors["green"])
+        )
+        blue_ok = map(
+            le, islice(self.sorted_blue, stop), repeat(max_colors["blue"])
+        )
+        possible = list(map(and_, green_ok, blue_ok))
+
+        return sum(possible), sum(compress(self.sorted_numbers, possible))
+
+    def count_possible_games(self, max_colors: dict[str, int]) -> int:
+        start = time.perf_counter()
+        count, _ = self.get_totals(max_colors)
+        self.record_query(start)
+        return count
+
+    def sum_possible_games(self, max_colors: dict[str, int]) -> int:
+        start = time.perf_counter()
+        _, total = self.get_totals(max_colors)
+        self.record_query(start)
+        return total
+
+    def sum_possible_games_batch(
+        self, limits: Iterable[dict[str, int]]
+    ) -> list[int]:
+        start = time.perf_counter()
+        totals = [self.get_totals(max_colors)[1] for max_colors in limits]
+        self.record_query(start, len(totals))
+        return totals
+
+    def get_possible_games(self, max_colors: dict[str, int]) -> list[int]:
+        """
+        Returns the fitting game numbers, in table order. Only the buckets
+        are scanned, not the individual games.
+        """
+        start = time.perf_counter()
+        red, green, blue = self.get_cell(max_colors)
+
+        positions: list[int] = list()
+        for (cell_red, cell_green, cell_blue), bucket in self.buckets.items():
+            if cell_red <= red and cell_green <= green and cell_blue <= blue:
+                positions.extend(bucket)
+        positions.sort()
+
+        possible_games = [self.game_numbers[i] for i in positions]
+        self.record_query(start)
+        return possible_games
+
+    def record_query(self, start: float, queries: int = 1):
+        self.query_seconds += time.perf_counter() - start
+        self.queries += queries
+
+    def __repr__(self):
+        return (
+            f"GameIndex(build={self.build_seconds:.6f}s, "
+            f"query={self.query_seconds:.6f}s, queries={self.queries})"
+        )
 
 
 # PART 2
@@ -56,13 +318,8 @@ def power_of_game(colors: dict[str, int]) -> int:
     return math.prod(colors.values())
 
 
-def sum_all_powers_of_games(games: dict[int, dict[str, int]]) -> int:
-    total = 0
-
-    for game in games.values():
-        total += power_of_game(game)
-
-    return total
+def sum_all_powers_of_games(games: GameTable) -> int:
+    return sum(map(mul, map(mul, games.red, games.green), games.blue))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,36 @@
 import math
 import re
-from typing import Match
+from array import array
+from bisect import bisect_right
+from typing import Generator, Iterable, NamedTuple, Optional, TypeVar
+
+T = TypeVar("T")
 
 NOT_SYMBOLS = "0123456789."
+SYMBOL_PATTERN = r"[^0-9.]"
+NUMBER_PATTERN = r"\d+"
+
+NEIGHBORS = [
+    (dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dx, dy) != (0, 0)
+]
+
+# bytes.translate tables turning a row into a string of "0"/"1" bits.
+SYMBOL_BITS = bytes(
+    ord("0") if chr(x) in NOT_SYMBOLS else ord("1") for x in range(256)
+)
+DIGIT_BITS = bytes(
+    ord("1") if chr(x).isdigit() else ord("0") for x in range(256)
+)
+
+
+class NumberIndex(NamedTuple):
+    width: int
+    height: int
+    # Id of the number covering each cell (row-major), -1 if none.
+    labels: array
+    numbers: list[int]
+    # (x, y, character) of every symbol in the grid.
+    symbols: list[tuple[int, int, str]]
 
 
 def is_symbol(char: str) -> bool:
@@ -29,81 +57,242 @@ def get_grid_from_input(filename: str) -> list[str]:
     return grid
 
 
-def get_numbers_from_grid(grid: list[str]) -> int:
-    pattern = r"\d+"
-    total = 0
-    max_y = len(grid)
-    for i, line in enumerate(grid):
-        for match in re.finditer(pattern, line):
+def build_number_index(grid: list[str]) -> NumberIndex:
+    height = len(grid)
+    width = max((len(line) for line in grid), default=0)
+
+    labels = array("i", [-1]) * (width * height)
+    numbers: list[int] = list()
+    symbols: list[tuple[int, int, str]] = list()
+
+    for y, line in enumerate(grid):
+        row = y * width
+        for match in re.finditer(NUMBER_PATTERN, line):
             start, end = match.span()
-            valid = False
+            labels[row + start : row + end] = array("i", [len(numbers)]) * (
+                end - start
+            )
+            numbers.append(int(match.group()))
 
-            if start - 1 > 0:
-                start -= 1
-            end = end + 1
+        for match in re.finditer(SYMBOL_PATTERN, line):
+            symbols.append((match.start(), y, match.group()))
 
-            # mid
-            if contains_symbol(line[start:end]):
-                valid = True
+    return NumberIndex(width, height, labels, numbers, symbols)
 
-            if i - 1 > 0 and contains_symbol(grid[i - 1][start:end]):
-                valid = True
 
-            if i + 1 < max_y and contains_symbol(grid[i + 1][start:end]):
-                valid = True
+def get_adjacent_numbers(index: NumberIndex, x: int, y: int) -> set[int]:
+    # Ids of the numbers in the eight cells surrounding (x, y)
+    adjacent: set[int] = set()
 
-            if valid:
-                total += int(match.group())
+    for dx, dy in NEIGHBORS:
+        nx, ny = x + dx, y + dy
+        if 0 <= nx < index.width and 0 <= ny < index.height:
+            number_id = index.labels[ny * index.width + nx]
+            if number_id >= 0:
+                adjacent.add(number_id)
 
-    return total
+    return adjacent
+
+
+def get_numbers_from_grid(
+    grid: list[str], index: Optional[NumberIndex] = None
+) -> int:
+    if index is None:
+        index = build_number_index(grid)
+
+    part_numbers: set[int] = set()
+    for x, y, _ in index.symbols:
+        part_numbers |= get_adjacent_numbers(index, x, y)
+
+    return sum(index.numbers[number_id] for number_id in part_numbers)
 
 
 # PART 2
 
 
-def get_gear_ratios(grid: list[str]) -> int:
+def get_gear_ratios(
+    grid: list[str], index: Optional[NumberIndex] = None
+) -> int:
     # Add the product of gear (*) that is adjacent to exactly two numbers.
     # adjacent is all surroundings including top and bottom and diagonals
+    if index is None:
+        index = build_number_index(grid)
+
+    total = 0
+    for x, y, symbol in index.symbols:
+        if symbol != "*":
+            continue
+
+        adjacent_numbers = get_adjacent_numbers(index, x, y)
+
+        # only add if the gear is surrounded by exactly two numbers
+        if len(adjacent_numbers) == 2:
+            total += math.prod(index.numbers[i] for i in adjacent_numbers)
+
+    return total
+
+
+# BITMASK MODE
+
+
+def get_row_mask(line: str, bits_table: bytes) -> int:
+    # Bit x of the result is set when column x maps to "1" in the table.
+    # Only ASCII rows have one byte per column, so anything else raises.
+    bits = line.encode("ascii").translate(bits_table)
+    return int(bits[::-1], 2) if bits else 0
+
+
+def dilate_row(mask: int) -> int:
+    return mask | (mask << 1) | (mask >> 1)
+
+
+def sum_part_numbers_in_row(line: str, digits: int, adjacent: int) -> int:
+    """
+    Sums the numbers of a row that touch the `adjacent` mask.
+
+    Digits under the mask are grown left and right within their digit runs
+    until they cover whole numbers, then only those runs are converted.
+    """
+    valid = digits & adjacent
+    while True:
+        grown = dilate_row(valid) & digits
+        if grown == valid:
+            break
+        valid = grown
+
+    total = 0
+    for match in re.finditer("1+", format(valid, "b")[::-1]):
+        start, end = match.span()
+        total += int(line[start:end])
+
+    return total
+
+
+def get_numbers_from_grid_masked(grid: list[str]) -> int:
+    """
+    Bit-parallel version of `get_numbers_from_grid`.
+
+    Every row becomes an integer bitmask of its symbols and of its digits.
+    The symbol masks are dilated over the 3x3 neighbourhood with shifts and
+    ors, and the numbers touching the dilated mask are summed per row, so no
+    Python code runs per character.
+    """
+    symbols = [dilate_row(get_row_mask(line, SYMBOL_BITS)) for line in grid]
 
-    pattern_number = r"\d+"
-    pattern_gear = r"\*"
     total = 0
-    max_y = len(grid)
     for y, line in enumerate(grid):
-        for match in re.finditer(pattern_gear, line):
-            start, end = match.span()
-            if start - 1 > 0:
-                start -= 1
-            end += 1
-
-            number_matches: list[tuple[int, list[Match[str]]]] = list()
-
-            number_matches.append((y, list(re.finditer(pattern_number, line))))
-            if y - 1 >= 0:
-                number_matches.append(
-                    (y - 1, list(re.finditer(pattern_number, grid[y - 1])))
-                )
-            if y + 1 < max_y:
-                number_matches.append(
-                    (y + 1, list(re.finditer(pattern_number, grid[y + 1])))
-                )
-
-            adjacent_numbers: set[int] = set()
-
-            for h, numbers in number_matches:
-                for number in numbers:
-                    number_start, number_end = number.span()
-                    number_end -= 1
-
-                    for i in range(start, end):
-                        if i in range(*number.span()):
-                            adjacent_numbers.add(int(number.group()))
-
-            # only add if the gear is surrounded by exactly two numbers
+        adjacent = symbols[y]
+        if y > 0:
+            adjacent |= symbols[y - 1]
+        if y + 1 < len(grid):
+            adjacent |= symbols[y + 1]
+
+        digits = get_row_mask(line, DIGIT_BITS)
+        total += sum_part_numbers_in_row(line, digits, adjacent)
+
+    return total
+
+
+# STREAMING MODE
+
+
+def stream_grid_rows(filename: str) -> Generator[str, None, None]:
+    with open(filename, "r") as file:
+        for line in file:
+            yield line.strip()
+
+
+def sliding_window(
+    items: Iterable[T],
+) -> Generator[tuple[Optional[T], T, Optional[T]], None, None]:
+    # Yields (previous, current, next) for every item, None past the edges
+    iterator = iter(items)
+    for current in iterator:
+        break
+    else:
+        return
+
+    previous: Optional[T] = None
+    for following in iterator:
+        yield previous, current, following
+        previous, current = current, following
+
+    yield previous, current, None
+
+
+def stream_numbers_from_grid(
+    rows: Iterable[str],
+) -> Generator[int, None, None]:
+    """
+    Streaming version of `get_numbers_from_grid`: keeps only three rows in
+    memory and yields the part number total of every row as it advances.
+    """
+    masked_rows = (
+        (line, dilate_row(get_row_mask(line, SYMBOL_BITS))) for line in rows
+    )
+
+    for previous, current, following in sliding_window(masked_rows):
+        line, adjacent = current
+        if previous is not None:
+            adjacent |= previous[1]
+        if following is not None:
+            adjacent |= following[1]
+
+        digits = get_row_mask(line, DIGIT_BITS)
+        yield sum_part_numbers_in_row(line, digits, adjacent)
+
+
+RowNumbers = tuple[list[int], list[int], list[int]]  # starts, ends, values
+
+
+def get_row_numbers(line: str) -> RowNumbers:
+    starts: list[int] = list()
+    ends: list[int] = list()
+    values: list[int] = list()
+
+    for match in re.finditer(NUMBER_PATTERN, line):
+        starts.append(match.start())
+        ends.append(match.end())
+        values.append(int(match.group()))
+
+    return starts, ends, values
+
+
+def get_numbers_around(row: RowNumbers, x: int) -> list[int]:
+    # Numbers of the row spanning columns x - 1 to x + 1
+    starts, ends, values = row
+    adjacent: list[int] = list()
+
+    i = bisect_right(starts, x + 1) - 1
+    while i >= 0 and ends[i] >= x:
+        adjacent.append(values[i])
+        i -= 1
+
+    return adjacent
+
+
+def stream_gear_ratios(rows: Iterable[str]) -> Generator[int, None, None]:
+    """
+    Streaming version of `get_gear_ratios`: keeps only three rows in memory
+    and yields the gear ratio total of every row as it advances.
+    """
+    numbered_rows = ((line, get_row_numbers(line)) for line in rows)
+
+    for previous, current, following in sliding_window(numbered_rows):
+        line, numbers = current
+        total = 0
+
+        for match in re.finditer(r"\*", line):
+            x = match.start()
+            adjacent_numbers = get_numbers_around(numbers, x)
+            for row in (previous, following):
+                if row is not None:
+                    adjacent_numbers.extend(get_numbers_around(row[1], x))
+
             if len(adjacent_numbers) == 2:
                 total += math.prod(adjacent_numbers)
 
-    return total
+        yield total
 
 
 if __name__ == "__main__":
@@ -111,9 +300,10 @@ if __name__ == "__main__":
     input_example = "./advent-of-code/2023/3/day3_input_example"
 
     grid = get_grid_from_input(input_file)
-    total = get_numbers_from_grid(grid)
+    index = build_number_index(grid)
+    total = get_numbers_from_grid(grid, index)
     print(f"Total Part Numbers: {total}")
 
     # PART 2
-    total_gears = get_gear_ratios(grid)
+    total_gears = get_gear_ratios(grid, index)
     print(f"Total gear ratios: {total_gears}")
@@ -1,6 +1,35 @@
 import re
+from collections import deque
+from typing import Generator, Iterable, NamedTuple
 
-Card = dict[str, list[int]]
+
+class Card(NamedTuple):
+    number: int
+    # Bit i is set when the i-th distinct number of the card (in order of
+    # appearance, winners first) is among these numbers
+    winner: int
+    draw: int
+    wins: int
+
+    @property
+    def points(self) -> int:
+        if self.wins == 0:
+            return 0
+        return 2 ** (self.wins - 1)
+
+
+def to_bitmasks(winner: str, draw: str) -> tuple[int, int]:
+    # Bit positions are assigned to the card's distinct numbers, so the masks
+    # stay as wide as the card whatever the numbers are
+    positions: dict[int, int] = dict()
+    masks: list[int] = list()
+    for numbers in (winner, draw):
+        mask = 0
+        for x in numbers.split():
+            mask |= 1 << positions.setdefault(int(x), len(positions))
+        masks.append(mask)
+
+    return masks[0], masks[1]
 
 
 def get_card_name(card_part: str) -> int:
@@ -17,62 +46,79 @@ def parse_file(filename: str) -> dict[int, Card]:
 
     with open(filename, "r") as file:
         for line in file:
-            cards.update(parse_card(line))
+            card = parse_card(line)
+            cards[card.number] = card
     return cards
 
 
-def parse_card(line: str) -> dict[int, Card]:
-    card: dict[int, Card] = dict()
+def parse_wins(filename: str) -> Generator[int, None, None]:
+    # Yields the number of wins of every card, in file order
+    with open(filename, "r") as file:
+        for line in file:
+            yield parse_card(line).wins
+
+
+def parse_card(line: str) -> Card:
     pattern = r":|\|"
     card_part, winner, draw = re.split(pattern, line)
     card_number = get_card_name(card_part)
 
-    winner = {int(x) for x in winner.split()}
-    draw = {int(x) for x in draw.split()}
-
-    intersection = winner & draw
-    wins = len(intersection)
-    if wins == 0:
-        points = 0
-    else:
-        points = 2 ** (wins - 1)
+    winner_mask, draw_mask = to_bitmasks(winner, draw)
+    wins = (winner_mask & draw_mask).bit_count()
 
-    card_info: Card = {
-        "winner": list(winner),
-        "draw": list(draw),
-        "info": [points, wins, 1],  # points, wins, number of cards
-    }
-
-    card[card_number] = card_info
-
-    return card
+    return Card(card_number, winner_mask, draw_mask, wins)
 
 
 def get_total_points(cards: list[Card]) -> int:
     total = 0
 
     for card in cards:
-        total += card["info"][0]
+        total += card.points
 
     return total
 
 
 # PART 2
-def count_total_cards(cards: dict[int, Card]) -> int:
+def count_cards_from_wins(wins_per_card: Iterable[int]) -> int:
+    """
+    Counts the total number of cards from the wins of each card, in order.
+
+    Instead of adding a card's copies to every card it wins, the copies are
+    added once where the run of won cards starts and removed where it ends,
+    in a difference array. Only the entries ahead of the current card are
+    kept, so memory is bounded by the largest win count.
+
+    Args:
+        wins_per_card (Iterable[int]): Number of wins of each card, in order.
+
+    Returns:
+        int: The total number of cards, originals and copies.
+    """
     total = 0
+    extra_copies = 0
+    # pending[k] is the change in extra copies at the k-th next card
+    pending: deque[int] = deque()
+
+    for wins in wins_per_card:
+        if pending:
+            extra_copies += pending.popleft()
 
-    for number, card in cards.items():
-        wins = card["info"][1]
-        amount = card["info"][2]
+        amount = 1 + extra_copies
         total += amount
 
-        for i in range(wins):
-            # Add current amount to `wins` successive cards:
-            cards[i + number + 1]["info"][2] += amount
+        if wins:
+            while len(pending) <= wins:
+                pending.append(0)
+            pending[0] += amount
+            pending[wins] -= amount
 
     return total
 
 
+def count_total_cards(cards: dict[int, Card]) -> int:
+    return count_cards_from_wins(card.wins for card in cards.values())
+
+
 if __name__ == "__main__":
     input_file = "./advent-of-code/2023/4/day4_input"
     input_example = "./advent-of-code/2023/4/day4_example"
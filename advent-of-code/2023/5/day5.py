@@ -1,16 +1,123 @@
 # Advent of Code, Day 5
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
 from collections import namedtuple
+from functools import lru_cache
+from itertools import repeat
+from operator import add
+from typing import Generator, Iterable, NamedTuple, Optional
 
 Mapping = namedtuple("Mapping", ["source", "dest"])
-MappingResult = namedtuple("MappingResult", ["mapped", "unmapped"])
 MappingsList = list[Mapping]
 
+# Start of the first piece of every compiled stage, so that any value falls
+# in some piece.
+LOWEST = -(1 << 63)
+
+
+class StageMap(NamedTuple):
+    """
+    A stage compiled into sorted, gap-filled pieces. Piece i covers
+    [starts[i], starts[i + 1]) and adds offsets[i] to its values; the last
+    piece is unbounded. Gaps between mappings are pieces with offset 0.
+    """
+
+    starts: tuple[int, ...]
+    offsets: tuple[int, ...]
+
+    def overlapping(
+        self, start: int, stop: Optional[int]
+    ) -> Generator[tuple[int, Optional[int], int], None, None]:
+        """
+        Yields (start, stop, offset) for every piece overlapping [start,
+        stop), clipped to it. A stop of None means unbounded.
+        """
+        i = bisect_right(self.starts, start) - 1
+
+        while stop is None or start < stop:
+            piece_stop: Optional[int] = None
+            if i + 1 < len(self.starts):
+                piece_stop = self.starts[i + 1]
+            if stop is not None and (piece_stop is None or piece_stop > stop):
+                piece_stop = stop
+
+            yield start, piece_stop, self.offsets[i]
+
+            if piece_stop is None:
+                break
+            start = piece_stop
+            i += 1
+
+    def map_range(self, seed: range) -> list[range]:
+        # Splits the seed across only the pieces it overlaps
+        mapped: list[range] = list()
+        for start, stop, offset in self.overlapping(seed.start, seed.stop):
+            if stop is not None:
+                mapped.append(range(start + offset, stop + offset))
+
+        return mapped
+
+    def minimum(self, seed: range) -> int:
+        # Values only increase within a piece, so each piece's minimum is at
+        # its start.
+        if not seed:
+            raise ValueError(f"Empty seed range: {seed}")
+
+        return min(
+            start + offset
+            for start, _, offset in self.overlapping(seed.start, seed.stop)
+        )
+
+    def map_points(self, points: array) -> array:
+        """
+        Maps every value of an int64 array at once: one bisect per value
+        finds its piece, then the piece offsets are added element-wise.
+        """
+        # starts[0] is LOWEST, so every index is at least 1
+        piece_offsets = (0,) + self.offsets
+        pieces = map(bisect_right, repeat(self.starts), points)
+        offsets = map(piece_offsets.__getitem__, pieces)
+
+        return array("q", map(add, points, offsets))
+
+    def compose(self, other: StageMap) -> StageMap:
+        # Returns the map applying `self`, then `other`
+        starts: list[int] = [LOWEST]
+        offsets: list[int] = [0]
+
+        for i, (start, offset) in enumerate(zip(self.starts, self.offsets)):
+            stop = self.starts[i + 1] if i + 1 < len(self.starts) else None
+            image_stop = None if stop is None else stop + offset
+
+            for image_start, _, other_offset in other.overlapping(
+                start + offset, image_stop
+            ):
+                add_piece(
+                    starts,
+                    offsets,
+                    image_start - offset,
+                    offset + other_offset,
+                )
+
+        return StageMap(tuple(starts), tuple(offsets))
+
+
+IDENTITY = StageMap((LOWEST,), (0,))
+
+
+def add_piece(starts: list[int], offsets: list[int], start: int, offset: int):
+    # Appends a piece, merging it into the previous one if they match
+    if offset != offsets[-1]:
+        starts.append(start)
+        offsets.append(offset)
+
 
 def parse_file(
     filename: str, part: int = 2
 ) -> tuple[list[range], list[MappingsList]]:
     seeds: list[range] = list()
-    mappings: list[MappingsList] = list()
     with open(filename, "r") as file:
         seed_line = file.readline()[7:].split()
 
@@ -25,91 +132,143 @@ def parse_file(
             # PART 1
             seeds = [range(int(x), int(x) + 1) for x in seed_line]
 
-        current_mapping: MappingsList = list()
-        for line in file:
-            if line == "\n":
-                continue
-
-            if ":" in line:
-                mappings.append(list())
-                current_mapping = mappings[-1]
-                continue
+        mappings = parse_mappings(file)
 
-            dest, source, step = [int(x) for x in line.split()]
-            dest_range = range(dest, dest + step)
-            source_range = range(source, source + step)
+    return seeds, mappings
 
-            mapping = Mapping(source_range, dest_range)
 
-            current_mapping.append(mapping)
+def parse_points_file(filename: str) -> tuple[array, list[MappingsList]]:
+    # Part 1 seeds as an int64 array, without building any range
+    with open(filename, "r") as file:
+        seeds = array("q", map(int, file.readline()[7:].split()))
+        mappings = parse_mappings(file)
 
     return seeds, mappings
 
 
-def map_range(seed: range, mapping: Mapping) -> MappingResult:
-    mapped: list[range] = list()
-    unmapped: list[range] = list()
+def parse_mappings(lines: Iterable[str]) -> list[MappingsList]:
+    mappings: list[MappingsList] = list()
 
-    source_range = mapping.source
-    dest_range = mapping.dest
-    difference = dest_range.start - source_range.start
+    current_mapping: MappingsList = list()
+    for line in lines:
+        if line == "\n":
+            continue
 
-    mapped_range_start = max(seed.start, source_range.start)
-    mapped_range_stop = min(seed.stop, source_range.stop)
+        if ":" in line:
+            mappings.append(list())
+            current_mapping = mappings[-1]
+            continue
 
-    # transform to destination range
-    if mapped_range_start <= mapped_range_stop:
-        mapped_range = range(
-            mapped_range_start + difference, mapped_range_stop + difference
-        )
-        mapped.append(mapped_range)
+        dest, source, step = [int(x) for x in line.split()]
+        dest_range = range(dest, dest + step)
+        source_range = range(source, source + step)
+
+        mapping = Mapping(source_range, dest_range)
 
-    # check for unmapped range
-    left = range(seed.start, min(seed.stop, source_range.start))
-    right = range(max(seed.start, source_range.stop), seed.stop)
-    # print(f"{left=}, {right=}")
-    unmapped = [x for x in [left, right] if x]
+        current_mapping.append(mapping)
 
-    return MappingResult(mapped, unmapped)
+    return mappings
+
+
+def compile_stage(mappings: MappingsList) -> StageMap:
+    starts: list[int] = [LOWEST]
+    offsets: list[int] = [0]
+
+    covered = LOWEST
+    for mapping in sorted(mappings, key=lambda x: x.source.start):
+        source_range = mapping.source
+        if not source_range:
+            continue
+
+        if source_range.start < covered:
+            raise ValueError(f"Overlapping mappings at {source_range}")
+
+        if source_range.start > covered:
+            add_piece(starts, offsets, covered, 0)
+
+        offset = mapping.dest.start - source_range.start
+        add_piece(starts, offsets, source_range.start, offset)
+        covered = source_range.stop
+
+    add_piece(starts, offsets, covered, 0)
+
+    return StageMap(tuple(starts), tuple(offsets))
+
+
+def compile_stages(mappings_list: list[MappingsList]) -> list[StageMap]:
+    return [compile_stage(mappings) for mappings in mappings_list]
+
+
+def compile_almanac(mappings_list: list[MappingsList]) -> StageMap:
+    """
+    Composes every stage into a single StageMap from seed to location.
+    Compiled almanacs are cached, keyed by their mappings.
+    """
+    return compile_almanac_cached(
+        tuple(tuple(mappings) for mappings in mappings_list)
+    )
+
+
+@lru_cache
+def compile_almanac_cached(
+    mappings_list: tuple[tuple[Mapping, ...], ...]
+) -> StageMap:
+    almanac = IDENTITY
+    for mappings in mappings_list:
+        almanac = almanac.compose(compile_stage(list(mappings)))
+
+    return almanac
+
+
+def find_lowest_location(
+    seeds: array, mappings_list: list[MappingsList]
+) -> int:
+    return min(compile_almanac(mappings_list).map_points(seeds))
+
+
+def coalesce_ranges(ranges: Iterable[range]) -> list[range]:
+    # Sorts the ranges and merges the overlapping or adjacent ones
+    merged: list[range] = list()
+
+    for current in sorted((x for x in ranges if x), key=lambda x: x.start):
+        if merged and current.start <= merged[-1].stop:
+            if current.stop > merged[-1].stop:
+                merged[-1] = range(merged[-1].start, current.stop)
+        else:
+            merged.append(current)
+
+    return merged
 
 
 def follow_the_map(
-    seeds: list[range], mappings_list: list[MappingsList]
+    seeds: list[range],
+    mappings_list: list[MappingsList],
+    range_counts: Optional[list[int]] = None,
 ) -> list[range]:
-    # print(seeds)
-    seeds_map_result = [MappingResult(list(), [seed]) for seed in seeds]
-    # print(f"{seeds_map_result=}")
-    for mappings in mappings_list:
-        # print("-new stage")
-        for mapping in mappings:
-            # print("--new map")
-            for i, seed in enumerate(seeds_map_result):
-                # print(f"\n---{seed=}")
-                # print(f"---{mapping=}")
-                unmapped_list: list[range] = list()
-                for unmapped_seed in seed.unmapped:
-                    # print(f"----{unmapped_seed=}")
-                    mapped, unmapped = map_range(unmapped_seed, mapping)
-                    # print(f"----{mapped=}")
-                    if mapped:
-                        seed.mapped.extend(mapped)
-                    unmapped_list.extend(unmapped)
-
-                seeds_map_result[i] = MappingResult(seed.mapped, unmapped_list)
-                # print(f"---new seed: {seeds_map_result[i]}")
-
-        # print(f"\n-old seed map: {seeds_map_result}")
-        seeds_map_result = [
-            MappingResult(list(), x.unmapped + x.mapped)
-            for x in seeds_map_result
-        ]
-        # print(f"-new seed map: {seeds_map_result}")
-    # print(seeds_map_result)
-    final_map: list[range] = list()
-    for seed in seeds_map_result:
-        final_map.extend(seed.unmapped)
-
-    return final_map
+    """
+    Maps the seed ranges through every stage. The live ranges are coalesced
+    after each stage so fragments do not multiply from stage to stage.
+
+    Args:
+        seeds (list[range]): The seed ranges.
+        mappings_list (list[MappingsList]): The mappings of every stage.
+        range_counts (Optional[list[int]]): If given, the number of live
+            ranges after each stage is appended to it.
+
+    Returns:
+        list[range]: The sorted, disjoint location ranges.
+    """
+    ranges = coalesce_ranges(seeds)
+
+    for stage in compile_stages(mappings_list):
+        ranges = coalesce_ranges(
+            mapped for seed in ranges for mapped in stage.map_range(seed)
+        )
+
+        if range_counts is not None:
+            range_counts.append(len(ranges))
+
+    return ranges
 
 
 if __name__ == "__main__":
@@ -117,11 +276,10 @@ if __name__ == "__main__":
     input_example = "./advent-of-code/2023/5/day5_input_example"
 
     # PART 1
-    seeds, mappings_list = parse_file(input_file, part=1)
-    locations = follow_the_map(seeds, mappings_list)
-    print(min([x.start for x in locations]))
+    seed_points, mappings_list = parse_points_file(input_file)
+    print(find_lowest_location(seed_points, mappings_list))
 
     # PART 2
     seeds, mappings_list = parse_file(input_file)
-    locations = follow_the_map(seeds, mappings_list)
-    print(min([x.start for x in locations]))
+    almanac = compile_almanac(mappings_list)
+    print(min(almanac.minimum(seed) for seed in seeds))
@@ -1,5 +1,5 @@
 import math
-from typing import Optional
+from typing import Iterable, Optional
 
 
 def parse_file(filename: str, part: Optional[int] = 2) -> dict[str, list[int]]:
@@ -19,22 +19,42 @@ def parse_file(filename: str, part: Optional[int] = 2) -> dict[str, list[int]]:
 
 
 def get_time_range(time: int, record: int) -> range:
-    # use quadratic formula
-    discriminant = ((time**2) - 4 * 1 * record) ** 0.5
-    x1 = math.ceil((time + discriminant) / 2)
-    x2 = int((time - discriminant) / 2)
+    """
+    Returns the button hold times that beat the record, i.e. every hold h
+    with h * (time - h) > record.
 
-    solution_range = range(x2, x1 - 1)
+    The roots of the quadratic are found with `math.isqrt` and corrected
+    with exact integer checks, so the result stays exact for arbitrarily
+    large times and records.
+    """
+    discriminant = time**2 - 4 * record
+    if discriminant < 0:
+        return range(0)
+
+    # (time - isqrt) // 2 is at most one below the shortest winning hold
+    shortest = (time - math.isqrt(discriminant)) // 2
+    if shortest * (time - shortest) <= record:
+        shortest += 1
+
+    longest = time - shortest
+    if shortest > longest:
+        return range(0)
+
+    solution_range = range(shortest, longest + 1)
     return solution_range
 
 
-def find_ways_to_win(times: list[int], records: list[int]) -> list[int]:
-    solutions: list[int] = list()
-    for time, record in zip(times, records):
-        num_solution = len(get_time_range(time, record))
-        solutions.append(num_solution)
+def count_ways_to_win(time: int, record: int) -> int:
+    # len() of a range is limited to a C ssize_t, so subtract the bounds
+    solution_range = get_time_range(time, record)
+    return solution_range.stop - solution_range.start
+
 
-    return solutions
+def find_ways_to_win(
+    times: Iterable[int], records: Iterable[int]
+) -> list[int]:
+    # Works on whole columns of races; Python ints keep every size exact
+    return list(map(count_ways_to_win, times, records))
 
 
 if __name__ == "__main__":
@@ -1,16 +1,27 @@
 # Advent of code, day 7
 from __future__ import annotations
 
+import heapq
+import os
+import struct
+import tempfile
+from array import array
 from collections import Counter
 from functools import total_ordering
-from typing import NamedTuple
+from itertools import islice, product
+from operator import attrgetter
+from typing import Generator, Iterable, Optional
+
+CARDS_PER_HAND = 5
+CARD_VALUES = 13
+HAND_CODES = CARD_VALUES**CARDS_PER_HAND
 
 
 @total_ordering
 class Hand:
-    class HandStrength(NamedTuple):
-        hand_type: int
-        card_strengths: list[int]
+    # The hand strength is packed in a single int `key`: the hand type in the
+    # high bits, followed by the strength of each card in 4 bits.
+    __slots__ = ("hand", "bid", "jokers", "key")
 
     HandTypes: dict[str, int] = {
         "Five of a kind": 6,
@@ -60,50 +71,205 @@ class Hand:
         "A": 12,
     }
 
-    def __init__(self, hand: str, bid: int):
+    # Card strengths when J is a regular Jack
+    CardStrengthNoJoker = {
+        "2": 0,
+        "3": 1,
+        "4": 2,
+        "5": 3,
+        "6": 4,
+        "7": 5,
+        "8": 6,
+        "9": 7,
+        "T": 8,
+        "J": 9,
+        "Q": 10,
+        "K": 11,
+        "A": 12,
+    }
+
+    def __init__(self, hand: str, bid: int, jokers: bool = True):
         self.hand = hand
         self.bid = bid
-        self.hand_strength = self.get_hand_strength()
+        self.jokers = jokers
+        self.key = self.get_hand_key()
 
-    def get_hand_strength(self) -> HandStrength:
-        hand_freqs = Counter(self.hand)
+    def get_card_strengths(self) -> list[int]:
+        if self.jokers:
+            strengths = Hand.CardStrength
+        else:
+            strengths = Hand.CardStrengthNoJoker
 
-        J_freq = hand_freqs.pop("J", 0)
-        hand_freq_values = sorted(hand_freqs.values())
+        return [strengths[x] for x in self.hand]
 
-        hand_map = (tuple(hand_freq_values), J_freq)
-        hand_type = Hand.HandTypeMapping.get(hand_map, None)
+    def get_hand_type(self) -> int:
+        card_strengths = self.get_card_strengths()
+        table = get_hand_type_table(self.jokers)
+        return table[get_hand_code(card_strengths)]
 
-        if hand_type is None:
-            raise ValueError(f"No HandType found for {self.hand}")
+    def get_hand_key(self) -> int:
+        card_strengths = self.get_card_strengths()
+        key = get_hand_type_table(self.jokers)[get_hand_code(card_strengths)]
+        for strength in card_strengths:
+            key = (key << 4) | strength
 
-        card_strengths: list[int] = [Hand.CardStrength[x] for x in self.hand]
-
-        return Hand.HandStrength(hand_type, card_strengths)
+        return key
 
     def __eq__(self, other) -> bool:
-        return self.hand_strength == other.hand_strength
+        return self.key == other.key
 
     def __lt__(self, other) -> bool:
-        return self.hand_strength < other.hand_strength
+        return self.key < other.key
 
     def __repr__(self):
-        return f"{self.hand}, {self.bid}, {self.hand_strength}"
+        return f"{self.hand}, {self.bid}, {self.key:#x}"
+
+
+def get_hand_code(card_strengths: list[int]) -> int:
+    # Base-13 code of a hand, first card most significant
+    if len(card_strengths) != CARDS_PER_HAND:
+        raise ValueError(f"Not a {CARDS_PER_HAND} card hand: {card_strengths}")
+
+    code = 0
+    for strength in card_strengths:
+        code = code * CARD_VALUES + strength
+
+    return code
+
+
+def classify_cards(card_strengths: Iterable[int], joker: Optional[int]) -> int:
+    hand_freqs = Counter(card_strengths)
+
+    J_freq = hand_freqs.pop(joker, 0)
+    hand_freq_values = sorted(hand_freqs.values())
+
+    hand_map = (tuple(hand_freq_values), J_freq)
+    hand_type = Hand.HandTypeMapping.get(hand_map, None)
+
+    if hand_type is None:
+        raise ValueError(f"No HandType found for {card_strengths}")
+
+    return hand_type
+
+
+def build_hand_type_table(jokers: bool = True) -> array:
+    """
+    Classifies every possible hand. The table is indexed by the hand code
+    (see `get_hand_code`) and holds the hand type of each code.
+    """
+    joker = Hand.CardStrength["J"] if jokers else None
+    hands = product(range(CARD_VALUES), repeat=CARDS_PER_HAND)
+
+    return array("B", (classify_cards(hand, joker) for hand in hands))
+
+
+# Hand type tables already loaded, by rule set (with or without jokers)
+hand_type_tables: dict[bool, array] = dict()
+
+# Cache files start with a magic string and the rule set they were built for
+HAND_TYPE_CACHE_MAGIC = b"AOC2023D7"
+# Every n-th hand code of a loaded table is classified again to check it
+HAND_TYPE_CHECK_STRIDE = 97
+
 
+def get_hand_type_cache_header(jokers: bool = True) -> bytes:
+    return HAND_TYPE_CACHE_MAGIC + (b"J" if jokers else b"N")
+
+
+def read_hand_type_cache(
+    cache_file: str, jokers: bool = True
+) -> Optional[array]:
+    # Returns the cached table, or None if missing, not for this rule set or
+    # holding wrong hand types (checked on a sample of the codes)
+    header = get_hand_type_cache_header(jokers)
+    try:
+        with open(cache_file, "rb") as file:
+            data = file.read(len(header) + HAND_CODES + 1)
+    except OSError:
+        return None
+
+    if not data.startswith(header) or len(data) != len(header) + HAND_CODES:
+        return None
+
+    table = data[len(header) :]
+    if max(table) > max(Hand.HandTypes.values()):
+        return None
+
+    joker = Hand.CardStrength["J"] if jokers else None
+    for code in range(0, HAND_CODES, HAND_TYPE_CHECK_STRIDE):
+        card_strengths = [
+            code // CARD_VALUES**i % CARD_VALUES
+            for i in reversed(range(CARDS_PER_HAND))
+        ]
+        if table[code] != classify_cards(card_strengths, joker):
+            return None
+
+    return array("B", table)
+
+
+def write_hand_type_cache(cache_file: str, table: array, jokers: bool = True):
+    # Writes to a temporary file first, so readers never see a partial table
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "wb") as file:
+            file.write(get_hand_type_cache_header(jokers))
+            table.tofile(file)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        # The cache is only an optimization
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def get_hand_type_table(
+    jokers: bool = True, cache_file: Optional[str] = None
+) -> array:
+    """
+    Returns the hand type table of the given rule set, built once per
+    process. If `cache_file` is given, the table is also cached in it to skip
+    the build on later runs. A cache file for the other rule set, truncated
+    or holding invalid hand types is rebuilt.
+    """
+    table = hand_type_tables.get(jokers)
+    if table is not None:
+        return table
+
+    if cache_file is not None:
+        table = read_hand_type_cache(cache_file, jokers)
+
+    if table is None:
+        table = build_hand_type_table(jokers)
+        if cache_file is not None:
+            write_hand_type_cache(cache_file, table, jokers)
+
+    hand_type_tables[jokers] = table
+    return table
+
+
+def classify_hand_codes(codes: Iterable[int], jokers: bool = True) -> array:
+    # Looks up the types of many hand codes at once
+    table = get_hand_type_table(jokers)
+    return array("B", map(table.__getitem__, codes))
+
+
+def parse_file(
+    filename: str, jokers: bool = True, cache_file: Optional[str] = None
+):
+    # Loads the hand type table first, from `cache_file` if given
+    get_hand_type_table(jokers, cache_file)
 
-def parse_file(filename: str):
     hands: list[Hand] = list()
     with open(filename, "r") as file:
         for line in file:
             hand, bid = line.split()
-            new_hand = Hand(hand, int(bid))
+            new_hand = Hand(hand, int(bid), jokers)
             hands.append(new_hand)
 
     return hands
 
 
 def rank_hands(hands: list[Hand]):
-    return sorted(hands)
+    return sorted(hands, key=attrgetter("key"))
 
 
 def get_winning(hand: Hand, rank: int) -> int:
@@ -121,6 +287,230 @@ def get_total_winnings(hands: list[Hand]) -> int:
     return total_winnings
 
 
+# OUT-OF-CORE MODE
+
+# A hand in a sorted run: packed key, position in the input file, bid. The
+# position keeps equal hands in file order, like the stable in-memory sort.
+RUN_RECORD = struct.Struct("<qqq")
+RUN_FAN_IN = 16
+
+
+def write_sorted_runs(
+    filename: str, run_dir: str, max_hands: int, jokers: bool = True
+) -> list[str]:
+    # Sorts the input in chunks of at most `max_hands`, one file per chunk
+    runs: list[str] = list()
+
+    with open(filename, "r") as file:
+        position = 0
+        while lines := list(islice(file, max_hands)):
+            run: list[tuple[int, int, int]] = list()
+            for line in lines:
+                hand, bid = line.split()
+                key = Hand(hand, int(bid), jokers).key
+                run.append((key, position, int(bid)))
+                position += 1
+            run.sort()
+
+            path = os.path.join(run_dir, f"run_{len(runs)}")
+            with open(path, "wb") as run_file:
+                for record in run:
+                    run_file.write(RUN_RECORD.pack(*record))
+            runs.append(path)
+
+    return runs
+
+
+def read_run(
+    path: str, block_records: int
+) -> Generator[tuple[int, int, int], None, None]:
+    block_size = RUN_RECORD.size * block_records
+    with open(path, "rb", buffering=block_size) as file:
+        while block := file.read(block_size):
+            yield from RUN_RECORD.iter_unpack(block)
+
+
+def merge_runs(paths: list[str], merged_path: str, block_records: int):
+    # Merges sorted runs into a new one, then removes them
+    block_size = RUN_RECORD.size * block_records
+    merged = heapq.merge(*(read_run(path, block_records) for path in paths))
+    with open(merged_path, "wb", buffering=block_size) as merged_file:
+        for record in merged:
+            merged_file.write(RUN_RECORD.pack(*record))
+
+    for path in paths:
+        os.remove(path)
+
+
+def get_total_winnings_external(
+    filename: str,
+    max_hands: int = 1_000_000,
+    jokers: bool = True,
+    fan_in: int = RUN_FAN_IN,
+) -> int:
+    """
+    Computes the total winnings of a hand file that does not fit in memory.
+
+    The file is parsed and sorted in runs of at most `max_hands` hands, which
+    are spilled to temporary files. Runs are merged at most `fan_in` at a
+    time, each pass writing new runs, until one last merge accumulates the
+    winnings. Peak memory is bounded by `max_hands`, split between the read
+    buffers of the open runs and the write buffer, and at most `fan_in` + 1
+    run files are open at once.
+
+    Args:
+        filename (str): The input file.
+        max_hands (int): Number of hands held in memory at once.
+        jokers (bool): Whether J is a joker.
+        fan_in (int): Number of runs merged at once, at least 2.
+
+    Returns:
+        int: The total winnings, the same as `get_total_winnings`.
+    """
+    if fan_in < 2:
+        raise ValueError(f"Fan-in must be at least 2, got {fan_in}!")
+
+    block_records = max(1, max_hands // (fan_in + 1))
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        runs = write_sorted_runs(filename, run_dir, max_hands, jokers)
+
+        merge_pass = 0
+        while len(runs) > fan_in:
+            merged_runs: list[str] = list()
+            for i in range(0, len(runs), fan_in):
+                group = runs[i : i + fan_in]
+                if len(group) == 1:
+                    merged_runs.append(group[0])
+                    continue
+
+                path = os.path.join(
+                    run_dir, f"merge_{merge_pass}_{len(merged_runs)}"
+                )
+                merge_runs(group, path, block_records)
+                merged_runs.append(path)
+
+            runs = merged_runs
+            merge_pass += 1
+
+        ranked = heapq.merge(*(read_run(path, block_records) for path in runs))
+
+        total_winnings = 0
+        for rank, (_, _, bid) in enumerate(ranked, start=1):
+            total_winnings += bid * rank
+
+    return total_winnings
+
+
+# INCREMENTAL MODE
+
+
+def get_hand_ordinals(jokers: bool = True) -> array:
+    """
+    Maps every hand code to its position among all possible hands sorted by
+    strength, so the ranking can be kept over a dense range of 13^5 slots.
+    """
+    table = get_hand_type_table(jokers)
+
+    # Hand codes are already ordered by card strengths, so within a hand type
+    # the ordinals follow the codes.
+    type_counts = Counter(table)
+    next_ordinal: dict[int, int] = dict()
+    ordinal = 0
+    for hand_type in sorted(type_counts):
+        next_ordinal[hand_type] = ordinal
+        ordinal += type_counts[hand_type]
+
+    ordinals = array("I", bytes(4 * HAND_CODES))
+    for code, hand_type in enumerate(table):
+        ordinals[code] = next_ordinal[hand_type]
+        next_ordinal[hand_type] += 1
+
+    return ordinals
+
+
+class FenwickTree:
+    def __init__(self, size: int):
+        self.tree = array("q", bytes(8 * (size + 1)))
+        self.total = 0
+
+    def add(self, index: int, value: int):
+        self.total += value
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += value
+            i += i & -i
+
+    def prefix_sum(self, stop: int) -> int:
+        # Sum of the values at indices [0, stop)
+        total = 0
+        i = stop
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+
+        return total
+
+
+class HandRanking:
+    """
+    Keeps the total winnings of a changing set of hands up to date in
+    O(log n) per update, without re-sorting.
+
+    Two Fenwick trees over the hand ordinals count the hands and sum their
+    bids. Inserting a hand ranks it after the hands it beats or ties with,
+    and moves every stronger hand up one rank, which adds the sum of their
+    bids. Equal hands rank in insertion order, like the stable sort of
+    `get_total_winnings`; `remove` takes out the latest inserted copy.
+    """
+
+    def __init__(self, jokers: bool = True):
+        self.jokers = jokers
+        self.ordinals = get_hand_ordinals(jokers)
+        self.counts = FenwickTree(HAND_CODES)
+        self.bids = FenwickTree(HAND_CODES)
+        self.hand_bids: dict[str, list[int]] = dict()
+        self.total_winnings = 0
+
+    def get_ordinal(self, hand: str) -> int:
+        if self.jokers:
+            strengths = Hand.CardStrength
+        else:
+            strengths = Hand.CardStrengthNoJoker
+
+        return self.ordinals[get_hand_code([strengths[x] for x in hand])]
+
+    def insert(self, hand: str, bid: int):
+        ordinal = self.get_ordinal(hand)
+
+        rank = self.counts.prefix_sum(ordinal + 1) + 1
+        stronger_bids = self.bids.total - self.bids.prefix_sum(ordinal + 1)
+        self.total_winnings += bid * rank + stronger_bids
+
+        self.counts.add(ordinal, 1)
+        self.bids.add(ordinal, bid)
+        self.hand_bids.setdefault(hand, list()).append(bid)
+
+    def remove(self, hand: str):
+        if hand not in self.hand_bids:
+            raise KeyError(f"{hand} not in ranking!")
+
+        bid = self.hand_bids[hand].pop()
+        if not self.hand_bids[hand]:
+            del self.hand_bids[hand]
+
+        ordinal = self.get_ordinal(hand)
+        self.counts.add(ordinal, -1)
+        self.bids.add(ordinal, -bid)
+
+        rank = self.counts.prefix_sum(ordinal + 1) + 1
+        stronger_bids = self.bids.total - self.bids.prefix_sum(ordinal + 1)
+        self.total_winnings -= bid * rank + stronger_bids
+
+    def __len__(self) -> int:
+        return self.counts.total
+
+
 if __name__ == "__main__":
     input_file = "./advent-of-code/2023/7/day7_input"
     input_example = "./advent-of-code/2023/7/day7_input_example"
@@ -1,10 +1,214 @@
-import itertools
 import math
 import re
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, NamedTuple, Optional
 
 Network = dict[str, dict[str, str]]
 
 
+class CompiledNetwork:
+    """
+    A network compiled to integer node ids with flat successor arrays.
+
+    `full_passes[k][node]` is the node reached from `node` after 2^k full
+    passes of the directions. The tables are built on demand, so any number
+    of steps is reached in O(log steps) table hops.
+    """
+
+    def __init__(self, directions: str, network: Network):
+        if not directions:
+            raise ValueError("No directions!")
+
+        self.directions = directions
+        self.names: list[str] = list(network)
+        self.ids: dict[str, int] = {
+            name: i for i, name in enumerate(self.names)
+        }
+
+        for node, successors in network.items():
+            for successor in successors.values():
+                if successor not in self.ids:
+                    raise KeyError(f"{successor} ({node}) not in network!")
+
+        self.left = array("i", (self.ids[x["L"]] for x in network.values()))
+        self.right = array("i", (self.ids[x["R"]] for x in network.values()))
+        # Successor array of each instruction
+        self.moves = [
+            self.left if direction == "L" else self.right
+            for direction in directions
+        ]
+
+        self.full_passes: list[array] = list()
+
+    def get_full_passes(self, level: int) -> array:
+        if not self.full_passes:
+            full_pass = array("i", range(len(self.names)))
+            for moves in self.moves:
+                full_pass = array("i", (moves[node] for node in full_pass))
+            self.full_passes.append(full_pass)
+
+        while len(self.full_passes) <= level:
+            previous = self.full_passes[-1]
+            self.full_passes.append(
+                array("i", (previous[node] for node in previous))
+            )
+
+        return self.full_passes[level]
+
+    def advance(self, start: str, steps: int) -> str:
+        # Node reached from `start` after `steps` steps
+        node = self.ids[start]
+        passes, remainder = divmod(steps, len(self.directions))
+
+        level = 0
+        while passes:
+            if passes & 1:
+                node = self.get_full_passes(level)[node]
+            passes >>= 1
+            level += 1
+
+        for moves in self.moves[:remainder]:
+            node = moves[node]
+
+        return self.names[node]
+
+    def find(self, start: str, targets: Iterable[str]) -> int:
+        # Steps from `start` to the first visit of any of the targets
+        if start not in self.ids:
+            raise KeyError(f"{start} not in network!")
+
+        is_target = bytearray(len(self.names))
+        for target in targets:
+            if target not in self.ids:
+                raise KeyError(f"{target} not in network!")
+            is_target[self.ids[target]] = 1
+
+        current = self.ids[start]
+        moves = self.moves
+        period = len(moves)
+        # Past this many steps a (node, instruction) state has repeated
+        limit = len(self.names) * period
+
+        steps = 0
+        while not is_target[current]:
+            if steps > limit:
+                raise ValueError(f"No target reachable from {start}!")
+
+            current = moves[steps % period][current]
+            steps += 1
+
+        return steps
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+# Cached steps of the states from which the target is never reached
+UNREACHABLE = -1
+
+
+class StepDistances:
+    """
+    Answers many `find_node` queries against the same network.
+
+    The steps from each (node, instruction index) state to a target are
+    memoized for every state a query walks through, so repeated queries are
+    cache hits and new queries stop as soon as they reach a known state. The
+    cache holds at most `maxsize` states and evicts the least recently used,
+    and a query keeps at most `maxsize` states of its walk to cache. States
+    from which the target is unreachable are cached too.
+    """
+
+    def __init__(
+        self, directions: str, network: Network, maxsize: int = 1_000_000
+    ):
+        self.compiled = CompiledNetwork(directions, network)
+        self.maxsize = maxsize
+        # (target, node, instruction) -> steps to target, or UNREACHABLE
+        self.cache: OrderedDict[tuple[int, int, int], int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, start: str, target: str) -> int:
+        for name in (start, target):
+            if name not in self.compiled.ids:
+                raise KeyError(f"{name} not in network!")
+
+        node = self.compiled.ids[start]
+        target_id = self.compiled.ids[target]
+
+        steps = self.cache.get((target_id, node, 0))
+        if steps is not None:
+            self.cache.move_to_end((target_id, node, 0))
+            self.hits += 1
+            if steps == UNREACHABLE:
+                raise ValueError(f"{target} not reachable from {start}!")
+            return steps
+
+        self.misses += 1
+        moves = self.compiled.moves
+        period = len(moves)
+        limit = len(self.compiled.names) * period
+
+        # Only the first `maxsize` states of the walk are kept to be cached,
+        # the rest are just counted.
+        path: list[tuple[int, int, int]] = list()
+        instruction = 0
+        steps = 0
+        remaining = 0
+        while node != target_id:
+            state = (target_id, node, instruction)
+            cached = self.cache.get(state)
+            if cached is not None:
+                self.cache.move_to_end(state)
+                remaining = cached
+                break
+
+            if steps > limit:
+                remaining = UNREACHABLE
+                break
+
+            if len(path) < self.maxsize:
+                path.append(state)
+            steps += 1
+            node = moves[instruction][node]
+            instruction = (instruction + 1) % period
+
+        # Store the states closest to the start last, as the most recent.
+        # States leading to an unreachable target are cached as such.
+        for i in reversed(range(len(path))):
+            if remaining == UNREACHABLE:
+                self.store(path[i], UNREACHABLE)
+            else:
+                self.store(path[i], remaining + steps - i)
+
+        if remaining == UNREACHABLE:
+            raise ValueError(f"{target} not reachable from {start}!")
+
+        return remaining + steps
+
+    def store(self, state: tuple[int, int, int], steps: int):
+        self.cache[state] = steps
+        self.cache.move_to_end(state)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.cache))
+
+    def cache_clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 def parse_file(filename: str) -> tuple[list[str], str, Network]:
     network: Network = dict()
     starts: list[str] = list()
@@ -28,39 +232,200 @@ def parse_file(filename: str) -> tuple[list[str], str, Network]:
 def find_node(
     start: str, target: str, directions: str, network: Network
 ) -> int:
-    current = start
-    steps = 0
-    directions_cycle = itertools.cycle(directions)
+    return CompiledNetwork(directions, network).find(start, [target])
 
-    while current != target:
-        direction = next(directions_cycle)
 
-        if current not in network:
-            raise KeyError(f"{current} not in network!")
+# PART 2
+class GhostCycle(NamedTuple):
+    """
+    The target visits of one start. From step `offset` on, the walk repeats
+    every `length` steps; `hits_before` are the target visits before
+    `offset` and `cycle_hits` the ones in [offset, offset + length).
+    """
 
-        current = network[current][direction]
+    offset: int
+    length: int
+    hits_before: list[int]
+    cycle_hits: list[int]
 
-        steps += 1
+    def is_hit(self, step: int) -> bool:
+        if step < self.offset:
+            return step in self.hits_before
 
-    return steps
+        position = self.offset + (step - self.offset) % self.length
+        return position in self.cycle_hits
 
 
-# PART 2
-def find_all_node(starts: list[str], directions: str, network: Network) -> int:
-    loops: list[int] = list()
+def detect_cycle(
+    left: array, right: array, directions: str, is_target: bytes, start: int
+) -> GhostCycle:
+    """
+    Walks from `start` one full pass of the directions at a time until the
+    node at the start of a pass repeats, recording every target visit.
+    """
+    moves = [left if direction == "L" else right for direction in directions]
+    period = len(moves)
 
-    for start in starts:
-        current = start
-        steps = 0
-        directions_cycle = itertools.cycle(directions)
-        while current.endswith("Z") is False:
-            direction = next(directions_cycle)
-            current = network[current][direction]
+    first_pass = array("i", [-1]) * len(left)
+    hits: list[int] = list()
+    node = start
+    passes = 0
 
-            steps += 1
+    while first_pass[node] < 0:
+        first_pass[node] = passes
+        for instruction, successors in enumerate(moves):
+            if is_target[node]:
+                hits.append(passes * period + instruction)
+            node = successors[node]
+        passes += 1
+
+    offset = first_pass[node] * period
+    length = (passes - first_pass[node]) * period
+
+    return GhostCycle(
+        offset,
+        length,
+        [step for step in hits if step < offset],
+        [step for step in hits if step >= offset],
+    )
+
+
+def combine_congruences(
+    a: tuple[int, int], b: tuple[int, int]
+) -> Optional[tuple[int, int]]:
+    # Generalized CRT: the (residue, modulus) matching both, if any
+    residue_a, modulus_a = a
+    residue_b, modulus_b = b
+
+    gcd = math.gcd(modulus_a, modulus_b)
+    if (residue_b - residue_a) % gcd:
+        return None
+
+    modulus = modulus_a // gcd * modulus_b
+    multiplier = (
+        (residue_b - residue_a)
+        // gcd
+        * pow(modulus_a // gcd, -1, modulus_b // gcd)
+    )
+    residue = residue_a + modulus_a * (multiplier % (modulus_b // gcd))
+
+    return residue % modulus, modulus
+
+
+# Target residues of a cycle: (cycle length, hits modulo the length)
+CycleResidues = tuple[int, frozenset[int]]
+
+
+def sieve_common_step(residues: set[CycleResidues], start: int) -> int:
+    """
+    Returns the first step from `start` on at which every cycle is on a hit,
+    trying only the hits of the longest cycle over one common period.
+    """
+    period = math.lcm(*(length for length, _ in residues))
+    length, hits = max(residues, key=lambda x: x[0])
+
+    steps: list[int] = list()
+    for hit in hits:
+        first = start + (hit - start) % length
+        for step in range(first, start + period, length):
+            if all(step % other in others for other, others in residues):
+                steps.append(step)
+                break
+
+    if not steps:
+        raise ValueError("The walks never reach their targets together!")
+
+    return min(steps)
+
+
+def first_common_step(cycles: list[GhostCycle]) -> int:
+    """
+    Returns the first step at which every walk is at a target.
+
+    Steps before every walk has entered its cycle are checked directly. The
+    rest are solved either by combining the cycle hits of every walk as
+    congruences, or by sieving the hits of the longest cycle over the common
+    period, whichever tries fewer candidates. Cycles with the same length and
+    hit residues are only counted once.
+    """
+    latest = max(cycles, key=lambda x: x.offset)
+
+    # Any step before `latest.offset` has to be one of its early hits
+    for step in latest.hits_before:
+        if all(cycle.is_hit(step) for cycle in cycles):
+            return step
+
+    residues: set[CycleResidues] = {
+        (cycle.length, frozenset(x % cycle.length for x in cycle.cycle_hits))
+        for cycle in cycles
+    }
+
+    period = math.lcm(*(length for length, _ in residues))
+    length, hits = max(residues, key=lambda x: x[0])
+    combinations = math.prod(len(hits) for _, hits in residues)
+    if len(hits) * (period // length) < combinations:
+        return sieve_common_step(residues, latest.offset)
+
+    congruences = {(0, 1)}
+    for length, hits in residues:
+        combined_congruences: set[tuple[int, int]] = set()
+        for congruence in congruences:
+            for hit in hits:
+                combined = combine_congruences(congruence, (hit, length))
+                if combined is not None:
+                    combined_congruences.add(combined)
+        congruences = combined_congruences
+
+    if not congruences:
+        raise ValueError("The walks never reach their targets together!")
+
+    # Smallest step at or after `latest.offset` of each congruence
+    steps: list[int] = list()
+    for residue, modulus in congruences:
+        if residue < latest.offset:
+            periods = (latest.offset - residue + modulus - 1) // modulus
+            residue += periods * modulus
+        steps.append(residue)
+
+    return min(steps)
+
+
+def find_all_node(
+    starts: list[str],
+    directions: str,
+    network: Network,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    Returns the first step at which every walk from `starts` is on a node
+    ending with "Z", for any network. The cycle of each start is detected in
+    a process pool of `workers` processes.
+    """
+    if not starts:
+        raise ValueError("No starting nodes!")
+
+    compiled = CompiledNetwork(directions, network)
+
+    is_target = bytearray(len(compiled.names))
+    for name, node_id in compiled.ids.items():
+        if name.endswith("Z"):
+            is_target[node_id] = 1
+
+    start_ids = [compiled.ids[start] for start in starts]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        cycles = list(
+            executor.map(
+                detect_cycle,
+                repeat(compiled.left),
+                repeat(compiled.right),
+                repeat(directions),
+                repeat(bytes(is_target)),
+                start_ids,
+            )
+        )
 
-        loops.append(steps)
-    return math.lcm(*loops)
+    return first_common_step(cycles)
 
 
 if __name__ == "__main__":
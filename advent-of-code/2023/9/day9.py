@@ -1,5 +1,7 @@
 import math
-from typing import Generator
+from functools import lru_cache
+from operator import add, mul
+from typing import Generator, Iterable
 
 InputGenerator = Generator[list[int], None, None]
 
@@ -10,16 +12,24 @@ def input_line_generator(filename: str) -> InputGenerator:
             yield [int(x) for x in line.strip().split()]
 
 
-def get_binomial_coeffs(n: int) -> list[int]:
-    return [((-1) ** k) * math.comb(n, k) for k in range(n + 1)]
+@lru_cache
+def get_next_value_coeffs(n: int) -> tuple[int, ...]:
+    # next = sum(coeffs[k] * data[k]) for any sequence of length n
+    return tuple(((-1) ** (n - 1 - k)) * math.comb(n, k) for k in range(n))
+
+
+@lru_cache
+def get_prev_value_coeffs(n: int) -> tuple[int, ...]:
+    # prev = sum(coeffs[k] * data[k]) for any sequence of length n
+    return tuple(((-1) ** k) * math.comb(n, k + 1) for k in range(n))
 
 
 def extrapolate_next_value(data: list[int]) -> int:
-    coeffs = 0
-    for i in range(1, len(data)):
-        binomial_coeffs = get_binomial_coeffs(i)
-        coeffs += sum(a * b for a, b in zip(binomial_coeffs, data))
-    return data[0] + coeffs
+    return sum(map(mul, get_next_value_coeffs(len(data)), data))
+
+
+def extrapolate_prev_value(data: list[int]) -> int:
+    return sum(map(mul, get_prev_value_coeffs(len(data)), data))
 
 
 def extrapolate_diffs(data: list[int]) -> int:
@@ -35,7 +45,54 @@ def extrapolate_all_next_values(input_gen: InputGenerator) -> list[int]:
 
 
 def extrapolate_all_prev_values(input_gen: InputGenerator) -> list[int]:
-    return [extrapolate_next_value(data[::-1]) for data in input_gen]
+    return [extrapolate_prev_value(data) for data in input_gen]
+
+
+def extrapolate_batch(input_gen: Iterable[list[int]]) -> tuple[int, int]:
+    """
+    Sums the next and the previous values of every line.
+
+    Extrapolation is linear in the data, so the lines are grouped by length
+    and summed column-wise; each group then needs a single dot product with
+    its cached coefficient row per direction. Python ints keep every sum
+    exact, however large.
+
+    Returns:
+        tuple[int, int]: The sums of the next and of the previous values.
+    """
+    column_sums: dict[int, list[int]] = dict()
+    for data in input_gen:
+        n = len(data)
+        if n in column_sums:
+            column_sums[n] = list(map(add, column_sums[n], data))
+        else:
+            column_sums[n] = list(data)
+
+    next_total = 0
+    prev_total = 0
+    for sums in column_sums.values():
+        next_total += extrapolate_next_value(sums)
+        prev_total += extrapolate_prev_value(sums)
+
+    return next_total, prev_total
+
+
+def extrapolate_files(
+    filenames: Iterable[str],
+) -> Generator[tuple[str, int, int], None, None]:
+    """
+    Reads and parses every line of every file once, producing both the next
+    and previous value sums of each file in the same pass.
+
+    Yields:
+        tuple[str, int, int]: The file name, the sum of the next values and
+        the sum of the previous values.
+    """
+    for filename in filenames:
+        next_total, prev_total = extrapolate_batch(
+            input_line_generator(filename)
+        )
+        yield filename, next_total, prev_total
 
 
 if __name__ == "__main__":
@@ -46,17 +103,11 @@ if __name__ == "__main__":
     # Answers:
     # PART 1: 114, 1681758908
 
-    for input_file in input_files:
+    for input_file, next_sum, prev_sum in extrapolate_files(input_files):
         print(f"\nUsing input file: {input_file}")
 
         # PART 1
-        input_gen = input_line_generator(input_file)
-        # prev_values = extrapolate_all_prev_values(input_gen)
-        prev_values = [extrapolate_diffs(line) for line in input_gen]
-        print(f"sum={sum(prev_values)}")
+        print(f"sum={next_sum}")
 
         # PART 2
-        input_gen = input_line_generator(input_file)
-        # next_values = extrapolate_all_next_values(input_gen)
-        next_values = [extrapolate_diffs(line[::-1]) for line in input_gen]
-        print(f"sum={sum(next_values)}")
+        print(f"sum={prev_sum}")